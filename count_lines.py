@@ -9,111 +9,408 @@ Count non-blank, non-comment lines in *.c, *.h, and *.cpp files.
 """
 
 import argparse
+import array
+import json
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterator, List
+from typing import Iterator, List, Optional
 
 DEFAULT_EXTS = {".c", ".h", ".cpp"}
 
+# Below this many files the process pool start-up costs more than it saves.
+PARALLEL_THRESHOLD = 16
+PARALLEL_CHUNKSIZE = 32
+
+# Files read at once in --async mode, to hide per-file latency on network filesystems.
+ASYNC_MAX_OPEN = 64
+
+# Bump whenever the counting rules change, so stale cached counts are dropped.
+CACHE_VERSION = 1
+
+def _walk_source_files(root: str, excludes: frozenset[str], exts: tuple[str, ...]) -> Iterator[tuple[Path, list[str]]]:
+    """Walk a directory with os.scandir, using the cached DirEntry type info."""
+    stack: list[tuple[str, list[str]]] = [(root, [])]
+    while stack:
+        path, rel_parts = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.name in excludes:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, rel_parts + [entry.name]))
+                elif entry.name.endswith(exts) and entry.is_file():
+                    yield Path(entry.path), rel_parts + [entry.name]
+
 def iter_source_files(root: Path, excludes: List[str], exts: set[str]) -> Iterator[tuple[Path, list[str]]]:
     """Yield *.c or *.h files from a directory, skipping excluded paths."""
+    excludes_set = frozenset(excludes)
     if root.is_file():
-        if root.suffix in exts and not any(exc in root.parts for exc in excludes):
+        if root.suffix in exts and excludes_set.isdisjoint(root.parts):
             rel_parts = list(root.relative_to(root.parent).parts)
             yield root, rel_parts
         return
 
     if root.is_dir():
-        for path in root.rglob("*"):
-            if path.is_file() and path.suffix in exts:
-                if not any(exc in path.parts for exc in excludes):
-                    rel_parts = list(path.relative_to(root).parts)
-                    yield path, rel_parts
-
-def look_for_code_in_line(line: str) -> bool:
-    idx = 0
-    in_comment = True
-    while idx < len(line):
+        if not excludes_set.isdisjoint(root.parts):
+            return
+        yield from _walk_source_files(str(root), excludes_set, tuple(exts))
+
+# Bytes that never make a line count as code (backslash is a line continuation).
+BLANK_BYTES = b" \t\r\x0b\x0c\\"
+
+# Comment openings, the only events the scanner stops at outside comments.
+_TOKENS = re.compile(rb"/[*/]")
+# A byte of code, searched in place rather than on a stripped copy.
+_CODE_BYTE = re.compile(b"[^\n" + re.escape(BLANK_BYTES) + b"]")
+# Lines holding at least one byte of code, for comment-free stretches.
+_CODE_LINE = re.compile(b"^[" + re.escape(BLANK_BYTES) + b"]*" + _CODE_BYTE.pattern, re.MULTILINE)
+
+def _scan(buf, pos: int, end: int, in_comment: bool) -> tuple[int, bool]:
+    """Count lines with code in buf[pos:end], jumping from comment to comment.
+
+    Returns (real, in_comment) where in_comment tells whether a block
+    comment is still open at the end.
+    """
+    real = 0
+    saw_code = False
+    while pos < end:
         if in_comment:
-            # inside the block comment: look for the closing
-            close_pos = line.find("*/", idx) 
+            # inside the block comment: jump to the closing, across lines
+            close_pos = buf.find(b"*/", pos, end)
             if close_pos == -1: # never closes
-                return (False, in_comment)
-            idx = close_pos + 2
+                break
+            if saw_code and buf.find(b"\n", pos, close_pos) != -1:
+                real += 1
+                saw_code = False
+            pos = close_pos + 2
             in_comment = False
             continue
 
-        # outside comment: look for the next block comment or real code
-        open_pos = line.find("/*", idx) 
-        if open_pos >= 0:
-            if line[idx:open_pos].strip():
-                return (True, in_comment)
+        # outside comment: everything up to the next comment is code or blank
+        m = _TOKENS.search(buf, pos, end)
+        stop = end if m is None else m.start()
+        first_nl = buf.find(b"\n", pos, stop)
+        if first_nl == -1:
+            if not saw_code and _CODE_BYTE.search(buf, pos, stop):
+                saw_code = True
+        else:
+            # finish the current line, count the whole ones in bulk,
+            # and start the line holding the comment
+            if saw_code or _CODE_BYTE.search(buf, pos, first_nl):
+                real += 1
+            last_nl = buf.rfind(b"\n", first_nl, stop)
+            if last_nl > first_nl:
+                real += len(_CODE_LINE.findall(buf, first_nl + 1, last_nl))
+            saw_code = _CODE_BYTE.search(buf, last_nl + 1, stop) is not None
+        if m is None:
+            break
+
+        pos = m.end()
+        if buf[stop + 1] == 0x2A: # /*
+            in_comment = True
+        else: # //, skip to the end of the line
+            line_end = buf.find(b"\n", pos, end)
+            if line_end == -1:
+                break
+            if saw_code:
+                real += 1
+                saw_code = False
+            pos = line_end + 1
+
+    if saw_code:
+        real += 1
+    return (real, in_comment)
+
+def look_for_code_in_line(line: str) -> tuple[bool, bool]:
+    """Look for code in a line that starts inside a block comment."""
+    data = line.encode("utf-8")
+    real, in_comment = _scan(data, 0, len(data), True)
+    return (real > 0, in_comment)
+
+def _count_buffer(buf) -> int:
+    """Count lines of code in a bytes-like buffer of C/C++ source."""
+    real, _ = _scan(buf, 0, len(buf), False)
+    return real
+
+# DFA states, each kept with a "line has code" variant (state | _CODE)
+_NORMAL, _SLASH, _BLOCK, _BLOCK_STAR, _LINE_COMMENT = range(5)
+_CODE = 8
+
+def _build_dfa() -> array.array:
+    """Build the transition table of the comment scanner, indexed by (state << 8) | byte.
+
+    Each entry holds (next_state << 8) | emit, where emit is 1 when the
+    byte ends a line that had code on it.
+    """
+    table = array.array("H", [0]) * (16 * 256)
+    for state in range(16):
+        kind, code = state & ~_CODE, state & _CODE
+        if kind > _LINE_COMMENT:
+            continue
+        for byte in range(256):
+            emit = 0
+            if byte == 0x0A: # \n
+                emit = 1 if code or kind == _SLASH else 0
+                nxt = _BLOCK if kind in (_BLOCK, _BLOCK_STAR) else _NORMAL
+            elif kind == _NORMAL:
+                if byte == 0x2F: # /
+                    nxt = _SLASH | code
+                elif byte in BLANK_BYTES:
+                    nxt = _NORMAL | code
+                else:
+                    nxt = _NORMAL | _CODE
+            elif kind == _SLASH:
+                if byte == 0x2A: # /*
+                    nxt = _BLOCK | code
+                elif byte == 0x2F: # //
+                    nxt = _LINE_COMMENT | code
+                else: # the pending slash was code
+                    nxt = _NORMAL | _CODE
+            elif kind == _BLOCK:
+                nxt = (_BLOCK_STAR if byte == 0x2A else _BLOCK) | code
+            elif kind == _BLOCK_STAR:
+                if byte == 0x2F: # */
+                    nxt = _NORMAL | code
+                else:
+                    nxt = (_BLOCK_STAR if byte == 0x2A else _BLOCK) | code
             else:
-                idx = open_pos + 2
-                in_comment = True
-                continue
+                nxt = _LINE_COMMENT | code
+            table[(state << 8) | byte] = (nxt << 8) | emit
+    return table
 
-        after = line[idx:].strip()
-        if after and after not in ["\\", "//"]:
-            return (True, in_comment)
+_DFA = _build_dfa()
 
-        idx += 1
-    return (False, in_comment)
+def _count_bytes(buf, table) -> int:
+    """Byte-at-a-time version of _count_buffer, written so numba can compile it.
 
-def count_real_lines(file_path: Path) -> int:
-    """Count lines that contain actual code (not blank, not pure comments)."""
-    in_block_comment = False
+    Runs the _DFA transition table: one lookup per byte and no branches.
+    """
     real = 0
+    state = 0
+    for i in range(len(buf)):
+        t = table[state | buf[i]]
+        real += t & 1
+        state = t & 0xFF00
+    # a final newline flushes the last line
+    return real + (table[state | 0x0A] & 1)
+
+try:
+    from _counter import count_buffer
+except ImportError:
+    count_buffer = _count_buffer
+
+_jit_checked = False
 
+def _enable_jit() -> None:
+    """Switch count_buffer to the numba kernel, if numba is installed and _counter is not built.
+
+    Importing numba costs far more than counting a few files, so this is
+    only called for runs of at least PARALLEL_THRESHOLD files.
+    """
+    global count_buffer, _jit_checked
+    if _jit_checked:
+        return
+    _jit_checked = True
+    if count_buffer is not _count_buffer:
+        return
     try:
-        with file_path.open("r", encoding="utf-8", errors="ignore") as f:
-            for raw in f:
-                line = raw.rstrip("\n")
-                if not line.strip():
-                    continue
+        import numba
+        import numpy
+    except ImportError:
+        return
 
-                stripped = line.lstrip()
-                if stripped.startswith("//"):
-                    continue
+    count_bytes_jit = numba.njit(cache=True)(_count_bytes)
+    dfa_array = numpy.frombuffer(_DFA, dtype=numpy.uint16)
 
-                # Start of block comment
-                if stripped.startswith("/*"):
-                    found, in_block_comment = look_for_code_in_line(stripped)
-                    if found:
-                        real += 1
-                    continue
+    def count_buffer_jit(buf) -> int:
+        return count_bytes_jit(numpy.frombuffer(buf, dtype=numpy.uint8), dfa_array)
 
-                # Inside block comment
-                if in_block_comment:
-                    found, in_block_comment = look_for_code_in_line(stripped)
-                    if found:
-                        real += 1
-                    continue
+    count_buffer = count_buffer_jit
 
-                # Regular code line
-                real += 1
+def _try_count_real_lines(file_path: Path) -> Optional[int]:
+    """Like count_real_lines, but None when the file could not be read."""
+    try:
+        return count_buffer(file_path.read_bytes())
     except Exception:
+        return None
+
+def count_real_lines(file_path: Path) -> int:
+    """Count lines that contain actual code (not blank, not pure comments)."""
+    return _try_count_real_lines(file_path) or 0
+
+def _count_batch(paths: List[Path]) -> list[Optional[int]]:
+    """Count a batch of files, asking the kernel to start reading all of them first."""
+    # workers started with spawn do not inherit the parent's choice of counter
+    _enable_jit()
+    if hasattr(os, "posix_fadvise"):
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+    return [_try_count_real_lines(p) for p in paths]
+
+def _count_files(paths: List[Path], async_io: bool = False) -> list[Optional[int]]:
+    """count_files, with None for the files that could not be read."""
+    if len(paths) >= PARALLEL_THRESHOLD:
+        _enable_jit()
+    if async_io:
+        with ThreadPoolExecutor(max_workers=ASYNC_MAX_OPEN) as executor:
+            return list(executor.map(_try_count_real_lines, paths))
+    if len(paths) < PARALLEL_THRESHOLD:
+        return [_try_count_real_lines(p) for p in paths]
+    batches = [paths[i:i + PARALLEL_CHUNKSIZE] for i in range(0, len(paths), PARALLEL_CHUNKSIZE)]
+    with ProcessPoolExecutor() as executor:
+        return [n for batch_counts in executor.map(_count_batch, batches) for n in batch_counts]
+
+def count_files(paths: List[Path], async_io: bool = False) -> list[int]:
+    """Count real lines of each file, in a process pool for larger batches.
+
+    With async_io, files are read by a pool of ASYNC_MAX_OPEN threads instead,
+    so that many slow opens and reads are in flight at the same time.
+    """
+    return [n or 0 for n in _count_files(paths, async_io)]
+
+def default_cache_file() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "source-code-line-counter" / "cache.json"
+
+def load_cache(cache_file: Path) -> dict[str, list[int]]:
+    """Load cached [mtime_ns, size, real] entries by path, empty if missing or stale."""
+    try:
+        data = json.loads(cache_file.read_text())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return {}
+    files = data.get("files")
+    if not isinstance(files, dict):
+        return {}
+    # Drop malformed entries, so they are recounted instead of crashing the run
+    return {
+        key: entry for key, entry in files.items()
+        if isinstance(entry, list) and len(entry) == 3 and all(type(n) is int for n in entry)
+    }
+
+def save_cache(cache_file: Path, entries: dict[str, list[int]]) -> None:
+    """Write the cache atomically, so a concurrent run never reads a partial file."""
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"version": CACHE_VERSION, "files": entries}))
+        os.replace(tmp, cache_file)
+    except OSError:
         pass
 
-    return real
+def _try_stat(path: Path) -> Optional[os.stat_result]:
+    try:
+        return path.stat()
+    except OSError:
+        return None
+
+def _prune_cache(entries: dict[str, list[int]], root: Path, paths: List[Path]) -> bool:
+    """Drop cached files under root that were not walked this run and no longer exist.
+
+    Files skipped by --exclude or --ext still exist, so their entries are kept.
+    Returns whether anything was removed.
+    """
+    prefix = str(root).rstrip(os.sep) + os.sep
+    walked = {str(p) for p in paths}
+    stale = [
+        key for key in entries
+        if (key == str(root) or key.startswith(prefix)) and key not in walked and not os.path.exists(key)
+    ]
+    for key in stale:
+        del entries[key]
+    return bool(stale)
+
+def count_files_cached(paths: List[Path], cache_file: Path, rebuild: bool = False,
+                       async_io: bool = False, root: Optional[Path] = None) -> list[int]:
+    """Like count_files, but reuse the counts of files whose mtime and size are unchanged.
 
-def main(path: str, excludes: List[str], exts: set[str], depth: int) -> None:
+    With rebuild, every file is recounted; cached entries for other files are kept.
+    With root, entries for files deleted from under root are dropped.
+    """
+    entries = load_cache(cache_file)
+    pruned = root is not None and _prune_cache(entries, root, paths)
+    file_counts = [0] * len(paths)
+    pending: list[tuple[int, str, list[int]]] = []
+
+    if async_io:
+        # on network mounts each stat is a round trip too
+        with ThreadPoolExecutor(max_workers=ASYNC_MAX_OPEN) as executor:
+            stats = list(executor.map(_try_stat, paths))
+    else:
+        stats = [_try_stat(p) for p in paths]
+
+    for i, (path, st) in enumerate(zip(paths, stats)):
+        if st is None or st.st_size == 0:
+            continue
+        key = str(path)
+        stamp = [st.st_mtime_ns, st.st_size]
+        entry = None if rebuild else entries.get(key)
+        if entry is not None and entry[:2] == stamp:
+            file_counts[i] = entry[2]
+        else:
+            pending.append((i, key, stamp))
+
+    if pending:
+        new_counts = _count_files([paths[i] for i, _, _ in pending], async_io)
+        for (i, key, stamp), file_count in zip(pending, new_counts):
+            if file_count is None:
+                # unreadable for now: count it as 0, but retry on the next run
+                continue
+            file_counts[i] = file_count
+            entries[key] = stamp + [file_count]
+
+    if pending or pruned:
+        save_cache(cache_file, entries)
+
+    return file_counts
+
+def main(path: str, excludes: List[str], exts: set[str], depth: int,
+         cache_file: Optional[Path] = None, rebuild_cache: bool = False,
+         async_io: bool = False) -> None:
     root = Path(path).expanduser().resolve()
     total = 0
 
-    counts: Dict[tuple[str, ...], int] = {}
+    dir_counts: defaultdict[tuple[str, ...], int] = defaultdict(int)
+    counts: defaultdict[tuple[str, ...], int] = defaultdict(int)
 
-    for src_file, rel_parts in iter_source_files(root, excludes, exts):
-        file_count = count_real_lines(src_file)
+    files = list(iter_source_files(root, excludes, exts))
+    paths = [src_file for src_file, _ in files]
+    if cache_file is None:
+        file_counts = count_files(paths, async_io)
+    else:
+        file_counts = count_files_cached(paths, cache_file, rebuild_cache, async_io, root)
+
+    for (src_file, rel_parts), file_count in zip(files, file_counts):
         total += file_count
 
-        # Build hierarchy up to depth
-        key: tuple[str, ...] = tuple()
-        for i in range(min(depth, len(rel_parts) - 1)):
-            key = tuple(rel_parts[: i + 1])
-            counts[key] = counts.get(key, 0) + file_count
+        # Sum per directory, cut at depth; parents are rolled up once per directory below
+        if depth > 0:
+            dir_counts[tuple(rel_parts[: min(depth, len(rel_parts) - 1)])] += file_count
+
+    # Build hierarchy up to depth
+    for dir_key, dir_count in dir_counts.items():
+        for i in range(1, len(dir_key) + 1):
+            counts[dir_key[:i]] += dir_count
 
-    # Sort by path for consistent output
-    for key in sorted(counts.keys(), key=lambda x: " ".join(x)):
+    # Sort by path components, so each directory is followed by its subdirectories
+    for key in sorted(counts):
         indent = "  " * (len(key) - 1)
         print(f"{indent}{key[-1]}/: {counts[key]}")
     print(f"TOTAL: {total}")
@@ -143,6 +440,22 @@ if __name__ == "__main__":
         default=0,
         help="Show counts per subdirectory up to this depth (0 = total only)",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the per-file count cache",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Ignore cached counts and recount every file, then refresh the cache",
+    )
+    parser.add_argument(
+        "--async",
+        dest="async_io",
+        action="store_true",
+        help="Read many files concurrently (for NFS, SMB or sshfs mounts)",
+    )
     args = parser.parse_args()
     if not args.ext:
         exts = set(DEFAULT_EXTS)
@@ -153,4 +466,5 @@ if __name__ == "__main__":
         excs = []
     else:
         excs = args.exclude
-    main(args.path, excs, exts, args.depth)
+    cache_file = None if args.no_cache else default_cache_file()
+    main(args.path, excs, exts, args.depth, cache_file, args.rebuild_cache, args.async_io)
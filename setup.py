@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Build the optional compiled counter: python3 setup.py build_ext --inplace
+
+count_lines.py falls back to its pure-Python scanner when _counter is not built.
+"""
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="source-code-line-counter",
+    py_modules=["count_lines"],
+    ext_modules=cythonize("_counter.pyx"),
+)
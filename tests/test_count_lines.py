@@ -8,6 +8,8 @@ import unittest
 from pathlib import Path
 import tempfile
 import sys
+import importlib.util
+import json
 
 # Add project root to path so we can import count_lines
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -86,6 +88,96 @@ class TestLineCounter(unittest.TestCase):
         self.assertEqual(count_real_lines(self.root / "main.c"), 7)
         self.assertEqual(count_real_lines(self.root / "utils.h"), 4)
 
+    def test_block_comment_after_code(self):
+        path = self.root / "trailing.c"
+        path.write_text("int x; /* starts here\n   int y;\n*/ int z; // done\n// /* not a block\nint w;\n")
+        self.assertEqual(count_real_lines(path), 3)
+
+    @unittest.skipUnless(importlib.util.find_spec("_counter"), "compiled counter not built")
+    def test_compiled_counter_matches(self):
+        from _counter import count_buffer
+        from count_lines import _count_buffer
+        for p, _ in iter_source_files(self.root, [], DEFAULT_EXTS):
+            data = p.read_bytes()
+            self.assertEqual(count_buffer(data), _count_buffer(data), p.name)
+
+    def test_byte_counter_matches(self):
+        from count_lines import _count_buffer, _count_bytes, _DFA
+        for p, _ in iter_source_files(self.root, [], DEFAULT_EXTS):
+            data = p.read_bytes()
+            self.assertEqual(_count_bytes(data, _DFA), _count_buffer(data), p.name)
+
+    def test_count_cache(self):
+        from count_lines import count_files_cached
+        import os
+        cache_file = self.root / "cache" / "cache.json"
+        path = self.root / "main.c"
+        self.assertEqual(count_files_cached([path], cache_file), [7])
+        self.assertTrue(cache_file.is_file())
+
+        # Same size and mtime: the cached count is reused without reading the file
+        st = path.stat()
+        path.write_text(path.read_text().replace("return 0;", "         "))
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(count_files_cached([path], cache_file), [7])
+        self.assertEqual(count_files_cached([path], cache_file, rebuild=True), [6])
+        self.assertEqual(count_files_cached([path], cache_file), [6])
+
+        # Empty files are counted from their size alone
+        empty = self.root / "zero.h"
+        empty.touch()
+        self.assertEqual(count_files_cached([empty, path], cache_file), [0, 6])
+        self.assertNotIn(str(empty), json.loads(cache_file.read_text())["files"])
+
+    def test_count_cache_rebuild_keeps_other_entries(self):
+        from count_lines import count_files_cached
+        cache_file = self.root / "cache" / "cache.json"
+        main_c, utils_h = self.root / "main.c", self.root / "utils.h"
+        count_files_cached([utils_h], cache_file)
+        self.assertEqual(count_files_cached([main_c], cache_file, rebuild=True), [7])
+        self.assertEqual(set(json.loads(cache_file.read_text())["files"]), {str(main_c), str(utils_h)})
+
+    def test_count_cache_prunes_deleted_files(self):
+        from count_lines import count_files_cached
+        cache_file = self.root / "cache" / "cache.json"
+        outside = tempfile.TemporaryDirectory()
+        self.addCleanup(outside.cleanup)
+        other = Path(outside.name) / "other.c"
+        other.write_text("int y;\n")
+
+        main_c, utils_h = self.root / "main.c", self.root / "utils.h"
+        count_files_cached([main_c, utils_h, other], cache_file)
+        utils_h.unlink()
+        (self.root / "excluded.h").write_text("int z;\n")
+        count_files_cached([self.root / "excluded.h"], cache_file)
+
+        self.assertEqual(count_files_cached([main_c], cache_file, root=self.root), [7])
+        self.assertEqual(set(json.loads(cache_file.read_text())["files"]),
+                         {str(main_c), str(other), str(self.root / "excluded.h")})
+
+    def test_count_cache_skips_read_errors(self):
+        from count_lines import count_files_cached
+        from unittest import mock
+        import errno
+        cache_file = self.root / "cache" / "cache.json"
+        path = self.root / "main.c"
+
+        with mock.patch.object(Path, "read_bytes", side_effect=OSError(errno.EIO, "I/O error")):
+            self.assertEqual(count_files_cached([path], cache_file), [0])
+        self.assertNotIn(str(path), json.loads(cache_file.read_text())["files"])
+        self.assertEqual(count_files_cached([path], cache_file), [7])
+
+    def test_count_cache_malformed(self):
+        from count_lines import count_files_cached, CACHE_VERSION
+        cache_file = self.root / "cache" / "cache.json"
+        cache_file.parent.mkdir()
+        main_c, utils_h = self.root / "main.c", self.root / "utils.h"
+        for files in ([], {str(main_c): 5, str(utils_h): [1, 2]}, {str(main_c): ["a", "b", "c"]}):
+            cache_file.write_text(json.dumps({"version": CACHE_VERSION, "files": files}))
+            self.assertEqual(count_files_cached([main_c, utils_h], cache_file), [7, 4])
+        cache_file.write_text("[1, 2")
+        self.assertEqual(count_files_cached([main_c, utils_h], cache_file), [7, 4])
+
     def test_extensions(self):
         total = sum(count_real_lines(p) for p, _ in iter_source_files(self.root, [], DEFAULT_EXTS))
         self.assertEqual(total, 12)  # 7 from main.c + 4 from utils.h + 1 from generated.c
@@ -135,5 +227,53 @@ class TestLineCounter(unittest.TestCase):
             self.assertEqual(len(dir_lines), len(expected_dirs))
             self.assertTrue(any("TOTAL:" in l for l in lines))
 
+    def test_depth_output_order(self):
+        from count_lines import main
+        import io
+        from contextlib import redirect_stdout
+
+        # "a b" sorts after "a/x" component-wise, but before it as a joined string
+        for rel in ("a/x/one.c", "a b/two.c", "a-c/three.c"):
+            (self.root / rel).parent.mkdir(parents=True, exist_ok=True)
+            (self.root / rel).write_text("int x;\n")
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(path=str(self.root), excludes=["auto_gen"], exts=DEFAULT_EXTS, depth=2)
+        self.assertEqual(output.getvalue().splitlines(), [
+            "a/: 1",
+            "  x/: 1",
+            "a b/: 1",
+            "a-c/: 1",
+            "TOTAL: 14",
+        ])
+
+    def test_parallel_count(self):
+        """Enough files to go through the process pool must give the same total."""
+        from count_lines import main, PARALLEL_THRESHOLD
+        import io
+        from contextlib import redirect_stdout
+
+        many_dir = self.root / "many"
+        many_dir.mkdir()
+        for i in range(PARALLEL_THRESHOLD):
+            (many_dir / f"file{i}.c").write_text("int a;\n/* comment */\nint b;\n")
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(path=str(self.root), excludes=[], exts=DEFAULT_EXTS, depth=1)
+        lines = output.getvalue().strip().splitlines()
+        self.assertIn(f"many/: {2 * PARALLEL_THRESHOLD}", lines)
+        self.assertEqual(lines[-1], f"TOTAL: {12 + 2 * PARALLEL_THRESHOLD}")
+
+    def test_async_io_count(self):
+        from count_lines import count_files, count_files_cached
+        paths = [p for p, _ in iter_source_files(self.root, [], DEFAULT_EXTS)]
+        self.assertEqual(count_files(paths, async_io=True), count_files(paths))
+
+        cache_file = self.root / "cache" / "cache.json"
+        for _ in range(2):
+            self.assertEqual(count_files_cached(paths, cache_file, async_io=True), count_files(paths))
+
 if __name__ == "__main__":
     unittest.main()
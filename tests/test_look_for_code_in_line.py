@@ -26,6 +26,8 @@ class TestLookForCodeInLine(unittest.TestCase):
             ("test",                       (False, True)),
             ("test */ /* ",                (False, True)),
             ("test */ \\",                 (False, False)),
+            ("*/ test /* ",                (True,  True)),
+            ("*/ // test",                 (False, False)),
         ]
         for line, expected in cases:
             self.assertEqual(look_for_code_in_line(line), expected)